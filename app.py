@@ -1,42 +1,145 @@
 """Streamlit interface for Windows Claude Computer Control."""
 
 import asyncio
-import base64
+import hashlib
 import os
 import time
+from dataclasses import asdict
 from io import BytesIO
-from typing import List, Optional, Union, cast
+from typing import TYPE_CHECKING, List, Union, cast
 
+import pybase64
 import streamlit as st
-from anthropic.types.beta import (
-    BetaContentBlockParam,
-    BetaMessageParam,
-    BetaTextBlockParam,
-    BetaToolResultBlockParam,
-)
-from PIL import Image, ImageGrab
+from PIL import Image
 
-from config import get_api_key, load_config, save_api_key, save_config
-from tools import ToolResult
-from windows_agent import WindowsAgent
+from config import EVICTED_IMAGE_PREFIX, IMAGE_CACHE_DIR, AppConfig, load_config, save_config
+
+# The Anthropic SDK, the agent and the tools (pyautogui, mss) are slow to import, so
+# they are imported where first needed and the UI can render before they load
+if TYPE_CHECKING:
+    from anthropic.types.beta import BetaContentBlockParam, BetaToolResultBlockParam
+
+    from tools import ToolResult
+    from windows_agent import WindowsAgent
 
 # Constants
 TITLE = "Claude Windows Computer Control"
-DEFAULT_SYSTEM_PROMPT = load_config().get("system_prompt", "")
+RENDER_INTERVAL = 0.05  # Minimum seconds between chat UI updates while Claude is responding
+IMAGE_CACHE_MAX_BYTES = 256 * 1024 * 1024  # Evicted screenshots kept on disk, oldest deleted first
 
 # Setup state
 if "messages" not in st.session_state:
     st.session_state.messages = []
-if "agent" not in st.session_state:
-    st.session_state.agent = None
 if "in_progress" not in st.session_state:
     st.session_state.in_progress = False
+if "pending_output" not in st.session_state:
+    st.session_state.pending_output = []
+if "agent" not in st.session_state:
+    st.session_state.agent = None
+    st.session_state.agent_settings = None
 
 def reset_conversation():
-    """Reset the conversation."""
+    """Reset the conversation and start over with a fresh agent."""
+    # The evicted screenshots can't be shown again once the history is gone
+    for content, index in evicted_image_slots(st.session_state.messages):
+        evicted_image_path(content[index]["text"]).unlink(missing_ok=True)
     st.session_state.messages = []
+    close_agent()
+
+def render_evicted_image(text: str):
+    """Render the screenshot referenced by an eviction placeholder, if it's still on disk."""
+    path = evicted_image_path(text)
+    if path.exists():
+        # st.image reads the file itself, so nothing is decoded or kept in memory here
+        st.image(str(path))
+    else:
+        st.caption(text)
+
+def is_evicted_placeholder(block) -> bool:
+    """Return whether a content block is the text placeholder for an evicted screenshot."""
+    return block.get("type") == "text" and block.get("text", "").startswith(EVICTED_IMAGE_PREFIX)
+
+def evicted_image_path(text: str):
+    """Return where the screenshot referenced by an eviction placeholder is stored."""
+    return IMAGE_CACHE_DIR / f"{text[len(EVICTED_IMAGE_PREFIX):].rstrip(']')}.jpg"
+
+def block_slots(messages, matches):
+    """Yield (content_list, index) for every matching block, newest first, including those inside tool results."""
+    for message in reversed(messages):
+        content = message.get("content")
+        if not isinstance(content, list):
+            continue
+        for i in range(len(content) - 1, -1, -1):
+            block = content[i]
+            if not isinstance(block, dict):
+                continue
+            if matches(block):
+                yield content, i
+            elif block.get("type") == "tool_result" and isinstance(block.get("content"), list):
+                inner = block["content"]
+                for j in range(len(inner) - 1, -1, -1):
+                    if isinstance(inner[j], dict) and matches(inner[j]):
+                        yield inner, j
+
+def image_slots(messages):
+    """Yield (content_list, index) for every image block, newest first."""
+    return block_slots(messages, lambda block: block.get("type") == "image")
+
+def evicted_image_slots(messages):
+    """Yield (content_list, index) for every evicted screenshot placeholder, newest first."""
+    return block_slots(messages, is_evicted_placeholder)
+
+def prune_image_cache(max_bytes: int = IMAGE_CACHE_MAX_BYTES):
+    """Delete the oldest evicted screenshots until the cache directory fits in max_bytes."""
+    try:
+        with os.scandir(IMAGE_CACHE_DIR) as entries:
+            files = [(entry.stat().st_mtime, entry.stat().st_size, entry.path) for entry in entries if entry.is_file()]
+    except FileNotFoundError:
+        return
+    total = sum(size for _, size, _ in files)
+    for _, size, path in sorted(files):
+        if total <= max_bytes:
+            break
+        try:
+            os.unlink(path)
+        except OSError:
+            continue
+        total -= size
+
+def evict_old_images(messages, keep_count: int):
+    """
+    Move screenshots older than the most recent keep_count out of the message history.
+    
+    The images are written to IMAGE_CACHE_DIR and replaced with a small text placeholder,
+    which is rendered from disk in the history (the agent leaves placeholders out of
+    what it sends to Claude). This keeps session state bounded no matter how long the
+    conversation gets; the cache directory itself is capped at IMAGE_CACHE_MAX_BYTES.
+    """
+    if keep_count <= 0:
+        return
+    
+    from anthropic.types.beta import BetaTextBlockParam
+    
+    written = False
+    for count, (content, index) in enumerate(image_slots(messages), start=1):
+        if count <= keep_count:
+            continue
+        source = content[index].get("source", {})
+        if source.get("type") != "base64":
+            continue
+        data = source["data"]
+        digest = hashlib.sha1(data.encode("ascii")).hexdigest()
+        path = IMAGE_CACHE_DIR / f"{digest}.jpg"
+        if not path.exists():
+            IMAGE_CACHE_DIR.mkdir(parents=True, exist_ok=True)
+            path.write_bytes(pybase64.b64decode(data))
+            written = True
+        content[index] = BetaTextBlockParam(type="text", text=f"{EVICTED_IMAGE_PREFIX}{digest}]")
+    
+    if written:
+        prune_image_cache()
 
-def render_message(role: str, content: Union[str, BetaContentBlockParam, ToolResult]):
+def render_message(role: str, content: Union[str, "BetaContentBlockParam", "ToolResult"]):
     """Render a message in the chat UI."""
     with st.chat_message(role):
         if isinstance(content, str):
@@ -50,28 +153,46 @@ def render_message(role: str, content: Union[str, BetaContentBlockParam, ToolRes
                 st.code(f"Tool: {content.get('name')}\nInput: {content.get('input')}")
             else:
                 st.write(content)
-        elif hasattr(content, "output") or hasattr(content, "error") or hasattr(content, "base64_image"):
+        elif hasattr(content, "output") or hasattr(content, "error") or hasattr(content, "image_bytes"):
             # It's a ToolResult
             if hasattr(content, "output") and content.output:
                 st.markdown(content.output)
             if hasattr(content, "error") and content.error:
                 st.error(content.error)
-            if hasattr(content, "base64_image") and content.base64_image:
-                image_data = base64.b64decode(content.base64_image)
-                image = Image.open(BytesIO(image_data))
-                st.image(image)
+            if hasattr(content, "image_bytes") and content.image_bytes:
+                st.image(content.image_bytes)
         else:
             st.write(content)
 
-def initialize_agent():
-    """Initialize the Windows Agent."""
-    if not st.session_state.agent:
-        st.session_state.agent = WindowsAgent()
+def get_agent(settings: AppConfig) -> "WindowsAgent":
+    """Return this session's Windows Agent, only building a new one when the settings change."""
+    from windows_agent import WindowsAgent
+    
+    if st.session_state.agent is None or st.session_state.agent_settings != settings:
+        # At most one agent per session: the one it replaces is shut down first
+        close_agent()
+        st.session_state.agent = WindowsAgent(
+            api_key=settings.api_key,
+            model=settings.model,
+            system_prompt=settings.system_prompt,
+            max_tokens=settings.max_output_tokens,
+            thinking_budget=settings.thinking_budget,
+            only_n_most_recent_images=settings.only_n_most_recent_images,
+        )
+        st.session_state.agent_settings = settings
     return st.session_state.agent
 
-async def process_message(human_message: str):
+def close_agent():
+    """Shut down this session's agent, if any, releasing its PowerShell process and screen grabber."""
+    agent = st.session_state.agent
+    st.session_state.agent = None
+    st.session_state.agent_settings = None
+    if agent is not None:
+        agent.close()
+
+async def process_message(agent: "WindowsAgent", human_message: str):
     """Process a message from the human and get a response from Claude."""
-    agent = initialize_agent()
+    from anthropic.types.beta import BetaMessageParam, BetaTextBlockParam
     
     # Add user message to history
     text_block = BetaTextBlockParam(type="text", text=human_message)
@@ -83,9 +204,29 @@ async def process_message(human_message: str):
     # Format messages for the API
     messages = cast(List[BetaMessageParam], st.session_state.messages.copy())
     
+    # Text blocks are buffered and flushed at most every RENDER_INTERVAL seconds, so a
+    # burst of blocks causes one UI update instead of one per block
+    last_render = [0.0]
+    
+    def flush_output():
+        """Render any buffered text as a single assistant message."""
+        pending = st.session_state.pending_output
+        if pending:
+            render_message("assistant", "\n\n".join(pending))
+            st.session_state.pending_output = []
+        last_render[0] = time.monotonic()
+    
     # Define callbacks
     def output_callback(content):
         """Callback for outputs from Claude."""
+        if isinstance(content, dict) and content.get("type") == "text":
+            st.session_state.pending_output.append(content.get("text", ""))
+            if time.monotonic() - last_render[0] > RENDER_INTERVAL:
+                flush_output()
+            return
+        
+        # Tool calls, tool results and errors are always shown straight away
+        flush_output()
         render_message("assistant", content)
     
     def tool_output_callback(result, tool_id):
@@ -101,29 +242,39 @@ async def process_message(human_message: str):
         output_callback=output_callback,
         tool_output_callback=tool_output_callback,
     )
+    flush_output()
     
     # Update messages in state
     st.session_state.messages = updated_messages
     
+    # Only the most recent screenshots are sent to Claude, so there's no need to keep the rest in memory
+    evict_old_images(st.session_state.messages, agent.only_n_most_recent_images)
+    
     # Mark as complete
     st.session_state.in_progress = False
 
 def take_screenshot():
     """Take a screenshot and send it to Claude."""
-    # Capture the screen
-    screenshot = ImageGrab.grab()
+    import mss
+    from anthropic.types.beta import BetaImageBlockParam, BetaTextBlockParam
+    
+    # Capture the primary monitor. Script reruns run on a new thread each time, and mss
+    # handles are bound to their thread, so the grabber is closed right away.
+    with mss.mss() as sct:
+        raw = sct.grab(sct.monitors[1])
+    screenshot = Image.frombytes("RGB", raw.size, raw.bgra, "raw", "BGRX")
     
     # Convert to base64
     buffered = BytesIO()
-    screenshot.save(buffered, format="PNG")
-    img_str = base64.b64encode(buffered.getvalue()).decode()
+    screenshot.save(buffered, format="JPEG", quality=80, optimize=False, progressive=False, subsampling=2)
+    img_str = pybase64.b64encode_as_string(buffered.getbuffer())
     
     # Create image block
     image_block = BetaImageBlockParam(
         type="image",
         source={
             "type": "base64",
-            "media_type": "image/png",
+            "media_type": "image/jpeg",
             "data": img_str,
         }
     )
@@ -142,6 +293,45 @@ def take_screenshot():
         st.write("Here's a screenshot of my screen:")
         st.image(screenshot)
 
+def render_history():
+    """Render the conversation history."""
+    for message in st.session_state.messages:
+        role = message["role"]
+        content = message["content"]
+        
+        if isinstance(content, list):
+            for item in content:
+                if is_evicted_placeholder(item):
+                    with st.chat_message(role):
+                        render_evicted_image(item["text"])
+                elif item.get("type") == "text":
+                    render_message(role, item)
+                elif item.get("type") == "image":
+                    with st.chat_message(role):
+                        st.image(pybase64.b64decode(item["source"]["data"]))
+                elif item.get("type") == "tool_result":
+                    render_tool_result(item)
+        else:
+            render_message(role, content)
+
+def render_tool_result(block: "BetaToolResultBlockParam"):
+    """Render a tool result block from the history."""
+    with st.chat_message("system"):
+        content = block.get("content")
+        if isinstance(content, str):
+            if block.get("is_error"):
+                st.error(content)
+            else:
+                st.markdown(content)
+            return
+        for item in content or []:
+            if is_evicted_placeholder(item):
+                render_evicted_image(item["text"])
+            elif item.get("type") == "text":
+                st.markdown(item.get("text", ""))
+            elif item.get("type") == "image":
+                st.image(pybase64.b64decode(item["source"]["data"]))
+
 def main():
     """Main application."""
     st.set_page_config(page_title=TITLE, page_icon="🖥️", layout="wide")
@@ -151,31 +341,25 @@ def main():
     with st.sidebar:
         st.header("Configuration")
         
+        # Read the configuration once per rerun; changes are written back once at the end
+        config = load_config()
+        current = AppConfig.from_dict(config)
+        
         # API Key
         api_key = st.text_input(
             "Anthropic API Key", 
-            value=get_api_key(),
+            value=current.api_key,
             type="password",
             help="Enter your Anthropic API key"
         )
-        if api_key != get_api_key():
-            save_api_key(api_key)
-            # Re-initialize agent if API key changed
-            st.session_state.agent = None
         
         # System prompt
-        config = load_config()
         system_prompt = st.text_area(
             "System Prompt", 
-            value=config.get("system_prompt", DEFAULT_SYSTEM_PROMPT),
+            value=current.system_prompt,
             height=300,
             help="Customize Claude's system prompt"
         )
-        if system_prompt != config.get("system_prompt"):
-            config["system_prompt"] = system_prompt
-            save_config(config)
-            # Re-initialize agent if system prompt changed
-            st.session_state.agent = None
         
         # Model selection
         model = st.selectbox(
@@ -184,59 +368,53 @@ def main():
             index=0,
             help="Select the Claude model to use"
         )
-        if model != config.get("model"):
-            config["model"] = model
-            save_config(config)
-            # Re-initialize agent if model changed
-            st.session_state.agent = None
         
         # Max tokens
         max_tokens = st.slider(
             "Max Output Tokens",
             min_value=1024,
             max_value=128000,
-            value=config.get("max_output_tokens", 4096),
+            value=current.max_output_tokens,
             step=1024,
             help="Maximum number of tokens in Claude's response"
         )
-        if max_tokens != config.get("max_output_tokens"):
-            config["max_output_tokens"] = max_tokens
-            save_config(config)
         
         # Thinking budget
         enable_thinking = st.checkbox(
             "Enable Thinking",
-            value=config.get("thinking_budget", 0) > 0,
+            value=current.thinking_budget > 0,
             help="Enable Claude's thinking mode"
         )
         thinking_budget = st.slider(
             "Thinking Budget",
             min_value=0,
             max_value=16384,
-            value=config.get("thinking_budget", 2048),
+            value=current.thinking_budget,
             step=1024,
             disabled=not enable_thinking,
             help="Budget for Claude's thinking tokens"
         )
-        if enable_thinking and thinking_budget != config.get("thinking_budget"):
-            config["thinking_budget"] = thinking_budget
-            save_config(config)
-        elif not enable_thinking and config.get("thinking_budget", 0) > 0:
-            config["thinking_budget"] = 0
-            save_config(config)
         
         # Image Management
         st.header("Image Management")
         only_n_most_recent_images = st.number_input(
             "Only send N most recent images",
             min_value=0,
-            value=config.get("only_n_most_recent_images", 3),  # Default to 3 images
+            value=current.only_n_most_recent_images,
             key="only_n_most_recent_images",
             help="To decrease the total tokens sent, remove older screenshots from the conversation"
         )
-        if only_n_most_recent_images != config.get("only_n_most_recent_images", 3):
-            config["only_n_most_recent_images"] = only_n_most_recent_images
-            save_config(config)
+        
+        settings = AppConfig(
+            api_key=api_key,
+            model=model,
+            system_prompt=system_prompt,
+            max_output_tokens=max_tokens,
+            thinking_budget=thinking_budget if enable_thinking else 0,
+            only_n_most_recent_images=only_n_most_recent_images,
+        )
+        if settings != current:
+            save_config({**config, **asdict(settings)})
         
         # Actions
         st.header("Actions")
@@ -256,23 +434,13 @@ def main():
             st.success("✅ Ready")
     
     # Render chat history
-    for message in st.session_state.messages:
-        role = message["role"]
-        content = message["content"]
-        
-        if isinstance(content, list):
-            for item in content:
-                if item.get("type") == "text":
-                    render_message(role, item)
-                elif item.get("type") == "image":
-                    with st.chat_message(role):
-                        image_data = base64.b64decode(item["source"]["data"])
-                        image = Image.open(BytesIO(image_data))
-                        st.image(image)
-                elif item.get("type") == "tool_result":
-                    render_message("system", item)
-        else:
-            render_message(role, content)
+    render_history()
+    
+    # Text left buffered by a response that was interrupted by a rerun; shown once, then
+    # dropped so it neither repeats on later reruns nor leaks into the next reply
+    if st.session_state.pending_output:
+        render_message("assistant", "\n\n".join(st.session_state.pending_output))
+        st.session_state.pending_output = []
     
     # Chat input
     if not st.session_state.in_progress:
@@ -281,8 +449,11 @@ def main():
             # Show the message immediately
             render_message("user", human_message)
             
+            # The agent is rebuilt only when one of these settings changed
+            agent = get_agent(settings)
+            
             # Process the message asynchronously
-            asyncio.run(process_message(human_message))
+            asyncio.run(process_message(agent, human_message))
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
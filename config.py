@@ -1,10 +1,16 @@
+import functools
 import os
 import json
+import stat
+from dataclasses import dataclass, fields
 from pathlib import Path
 
 # Configuration directory
 CONFIG_DIR = Path.home() / ".claude-windows-control"
 CONFIG_FILE = CONFIG_DIR / "config.json"
+# Screenshots moved out of the message history, and the text block that stands in for them
+IMAGE_CACHE_DIR = CONFIG_DIR / "cache"
+EVICTED_IMAGE_PREFIX = "[Older screenshot omitted: "
 
 # Default configuration
 DEFAULT_CONFIG = {
@@ -28,12 +34,37 @@ DEFAULT_CONFIG = {
 </IMPORTANT>"""
 }
 
+@dataclass(frozen=True)
+class AppConfig:
+    """The settings edited in the sidebar, compared as a whole to detect changes."""
+    api_key: str = DEFAULT_CONFIG["api_key"]
+    model: str = DEFAULT_CONFIG["model"]
+    system_prompt: str = DEFAULT_CONFIG["system_prompt"]
+    max_output_tokens: int = DEFAULT_CONFIG["max_output_tokens"]
+    thinking_budget: int = DEFAULT_CONFIG["thinking_budget"]
+    only_n_most_recent_images: int = 3
+    
+    @classmethod
+    def from_dict(cls, config):
+        """Build an AppConfig from a config dict, using defaults for missing keys and ignoring unknown ones."""
+        names = {field.name for field in fields(cls)}
+        return cls(**{key: value for key, value in config.items() if key in names})
+
 def ensure_config_dir():
     """Create configuration directory if it doesn't exist."""
     CONFIG_DIR.mkdir(parents=True, exist_ok=True)
     
 def load_config():
-    """Load configuration from file, or create default if it doesn't exist."""
+    """Load configuration from file, or create default if it doesn't exist.
+    
+    The file is only parsed once; later calls return a copy of the cached result
+    until save_config() writes a new version.
+    """
+    return dict(_cached_config())
+
+@functools.lru_cache(maxsize=1)
+def _cached_config():
+    """Read and parse the configuration file."""
     ensure_config_dir()
     if not CONFIG_FILE.exists():
         save_config(DEFAULT_CONFIG)
@@ -46,12 +77,25 @@ def load_config():
         return DEFAULT_CONFIG
 
 def save_config(config):
-    """Save configuration to file."""
+    """Save configuration to file.
+    
+    The file is written to a temporary sibling and moved into place, so a reader
+    never sees a partially written config.
+    """
     ensure_config_dir()
-    with open(CONFIG_FILE, 'w') as f:
-        json.dump(config, f, indent=2)
-    # Restrict file permissions to user only
-    os.chmod(CONFIG_FILE, 0o600)
+    tmp_file = CONFIG_FILE.with_name(CONFIG_FILE.name + ".tmp")
+    fd = os.open(tmp_file, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    try:
+        with os.fdopen(fd, 'w') as f:
+            json.dump(config, f, indent=2)
+            # Restrict file permissions to user only (new files are already created that way)
+            if stat.S_IMODE(os.fstat(f.fileno()).st_mode) != 0o600:
+                os.chmod(tmp_file, 0o600)
+        os.replace(tmp_file, CONFIG_FILE)
+    except BaseException:
+        tmp_file.unlink(missing_ok=True)
+        raise
+    _cached_config.cache_clear()
 
 def save_api_key(api_key):
     """Save API key to configuration."""
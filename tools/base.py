@@ -20,7 +20,7 @@ class ToolResult:
     """Represents the result of a tool execution."""
     output: Optional[str] = None
     error: Optional[str] = None
-    base64_image: Optional[str] = None
+    image_bytes: Optional[bytes] = None
     system: Optional[str] = None
 
     def __bool__(self):
@@ -37,7 +37,7 @@ class ToolResult:
         return ToolResult(
             output=combine_fields(self.output, other.output),
             error=combine_fields(self.error, other.error),
-            base64_image=combine_fields(self.base64_image, other.base64_image, False),
+            image_bytes=combine_fields(self.image_bytes, other.image_bytes, False),
             system=combine_fields(self.system, other.system),
         )
 
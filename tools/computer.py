@@ -1,19 +1,26 @@
 import asyncio
-import base64
+import ctypes
+import hashlib
 import io
+import sys
 import time
+from concurrent.futures import ThreadPoolExecutor
 from enum import Enum
 from typing import Literal, Optional, Tuple, Union, cast
 
+import mss
 import pyautogui
 import pygetwindow as gw
-from PIL import Image, ImageGrab
+from PIL import Image
 
 from .base import BaseAnthropicTool, ToolError, ToolResult
 
 # Configure pyautogui safety
 pyautogui.FAILSAFE = True
-pyautogui.PAUSE = 0.1  # Add small delay between pyautogui commands
+# No implicit sleep after every pyautogui call; actions that need time to settle
+# opt in through ComputerTool._post_action_settle
+pyautogui.PAUSE = 0.0
+pyautogui.DARWIN_CATCH_UP_TIME = 0.0
 
 # Define action types
 Action = Literal[
@@ -37,6 +44,79 @@ Action = Literal[
 
 ScrollDirection = Literal["up", "down", "left", "right"]
 
+# Win32 SendInput structures, used to type text in a single call
+INPUT_KEYBOARD = 1
+KEYEVENTF_KEYUP = 0x0002
+KEYEVENTF_UNICODE = 0x0004
+VK_RETURN = 0x0D
+VK_TAB = 0x09
+
+class _KEYBDINPUT(ctypes.Structure):
+    _fields_ = [
+        ("wVk", ctypes.c_ushort),
+        ("wScan", ctypes.c_ushort),
+        ("dwFlags", ctypes.c_ulong),
+        ("time", ctypes.c_ulong),
+        ("dwExtraInfo", ctypes.c_size_t),
+    ]
+
+class _MOUSEINPUT(ctypes.Structure):
+    _fields_ = [
+        ("dx", ctypes.c_long),
+        ("dy", ctypes.c_long),
+        ("mouseData", ctypes.c_ulong),
+        ("dwFlags", ctypes.c_ulong),
+        ("time", ctypes.c_ulong),
+        ("dwExtraInfo", ctypes.c_size_t),
+    ]
+
+class _INPUTUNION(ctypes.Union):
+    # MOUSEINPUT is the largest member and determines sizeof(INPUT)
+    _fields_ = [("ki", _KEYBDINPUT), ("mi", _MOUSEINPUT)]
+
+class _INPUT(ctypes.Structure):
+    _fields_ = [("type", ctypes.c_ulong), ("union", _INPUTUNION)]
+
+def _send_unicode_text(text: str) -> None:
+    """
+    Type text with a single SendInput call.
+    
+    Each UTF-16 code unit becomes a KEYEVENTF_UNICODE key down/up pair, so characters
+    outside the BMP are sent as surrogate pairs. Newlines and tabs are sent as the
+    Enter and Tab keys, since most applications ignore them as unicode input.
+    Falls back to pyautogui on platforms without SendInput.
+    """
+    if sys.platform != "win32":
+        pyautogui.write(text, interval=0.01)
+        return
+    
+    # Respect pyautogui's fail-safe: abort if the mouse is in a screen corner
+    pyautogui.failSafeCheck()
+    
+    events = []
+    for char in text.replace("\r\n", "\n"):
+        if char in "\r\n":
+            events.append((VK_RETURN, 0, 0))
+        elif char == "\t":
+            events.append((VK_TAB, 0, 0))
+        else:
+            utf16 = char.encode("utf-16-le")
+            for i in range(0, len(utf16), 2):
+                events.append((0, int.from_bytes(utf16[i:i + 2], "little"), KEYEVENTF_UNICODE))
+    
+    inputs = (_INPUT * (2 * len(events)))()
+    for i, (vk, scan, flags) in enumerate(events):
+        for j, up in enumerate((0, KEYEVENTF_KEYUP)):
+            item = inputs[2 * i + j]
+            item.type = INPUT_KEYBOARD
+            item.union.ki.wVk = vk
+            item.union.ki.wScan = scan
+            item.union.ki.dwFlags = flags | up
+    
+    sent = ctypes.windll.user32.SendInput(len(inputs), inputs, ctypes.sizeof(_INPUT))
+    if sent != len(inputs):
+        raise ctypes.WinError()
+
 class ComputerTool(BaseAnthropicTool):
     """
     A tool that allows Claude to interact with the Windows desktop environment 
@@ -45,12 +125,69 @@ class ComputerTool(BaseAnthropicTool):
     
     name = "computer"
     api_type = "computer_20250124"
-    _screenshot_delay = 0.5
+    _screenshot_delay_max = 0.5  # Longest wait for the screen to settle before a screenshot
+    _screenshot_poll_interval = 0.05  # Time between captures while waiting for the screen to settle
+    _typing_poll_interval = 0.1  # Keyboard input often triggers slower redraws (autocomplete, search)
+    # Seconds to wait after input before capturing, for actions whose effect isn't immediate
+    _post_action_settle = {
+        "key": 0.02,
+        "left_click": 0.03,
+        "double_click": 0.05,
+        "triple_click": 0.05,
+        "left_click_drag": 0.05,
+    }
+    _region_size = (800, 600)  # Screen area checked around the pointer for mouse actions
+    _max_region_captures = 4  # Frames reused after a region check before a full capture is forced
     
     def __init__(self):
         super().__init__()
         # Get screen dimensions
         self.width, self.height = pyautogui.size()
+        # Screenshots are sent to Claude at XGA resolution (1024x768)
+        self._target = (1024, 768)
+        # Ratios between API (target) coordinates and screen coordinates, fixed for the tool's lifetime
+        target_width, target_height = self._target
+        self._api_to_screen_x = self.width / target_width
+        self._api_to_screen_y = self.height / target_height
+        self._screen_to_api_x = target_width / self.width if self.width else 0.0
+        self._screen_to_api_y = target_height / self.height if self.height else 0.0
+        # Digest and encoding of the last screenshot, reused when the screen is unchanged
+        self._last_hash = None
+        self._last_image = None
+        # Last full capture at screen resolution, which region checks are compared against
+        self._screen = None
+        self._region_captures = 0
+        # All capturing and encoding runs on one long-lived thread, which owns the mss
+        # grabber (its GDI handles are bound to the thread that created it) and the
+        # encode buffer. Unlike the default executor, it isn't torn down by asyncio.run.
+        self._capture_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="screen-capture")
+        self._grabber = None
+        self._buffer = None
+    
+    @property
+    def _sct(self) -> mss.base.MSSBase:
+        """Return the screen grabber, creating it on first use. Only call on the capture thread."""
+        if self._grabber is None:
+            self._grabber = mss.mss()
+        return self._grabber
+    
+    def close(self) -> None:
+        """Release the screen grabber and stop the capture thread; called when the tool is thrown away."""
+        try:
+            self._capture_executor.submit(self._close_grabber)
+        except RuntimeError:
+            return  # Already closed
+        self._capture_executor.shutdown(wait=True)
+    
+    def _close_grabber(self) -> None:
+        """Close the mss grabber on the thread that created it."""
+        if self._grabber is not None:
+            self._grabber.close()
+            self._grabber = None
+    
+    async def _in_capture_thread(self, func, *args):
+        """Run a capture or encode step on the capture thread without blocking the event loop."""
+        return await asyncio.get_running_loop().run_in_executor(self._capture_executor, func, *args)
         
     def to_params(self) -> dict:
         """Returns the tool parameters for the Anthropic API."""
@@ -81,14 +218,15 @@ class ComputerTool(BaseAnthropicTool):
                 if coordinate is None:
                     raise ToolError("Coordinate is required for mouse_move")
                 x, y = self._validate_coordinates(coordinate)
-                pyautogui.moveTo(x, y)
-                return await self._with_screenshot(f"Mouse moved to {x}, {y}")
+                await asyncio.to_thread(pyautogui.moveTo, x, y)
+                return await self._with_screenshot(f"Mouse moved to {x}, {y}", location=(x, y))
                 
             elif action == "left_click_drag":
                 if coordinate is None:
                     raise ToolError("Coordinate is required for left_click_drag")
                 x, y = self._validate_coordinates(coordinate)
-                pyautogui.dragTo(x, y, button='left')
+                await asyncio.to_thread(pyautogui.dragTo, x, y, button='left')
+                await asyncio.sleep(self._post_action_settle[action])
                 return await self._with_screenshot(f"Mouse dragged to {x}, {y}")
             
             # Keyboard actions
@@ -98,8 +236,11 @@ class ComputerTool(BaseAnthropicTool):
                 if coordinate is not None:
                     raise ToolError("Coordinate is not accepted for key action")
                 
-                pyautogui.press(text)
-                return await self._with_screenshot(f"Key pressed: {text}")
+                await asyncio.to_thread(pyautogui.press, text)
+                await asyncio.sleep(self._post_action_settle[action])
+                return await self._with_screenshot(
+                    f"Key pressed: {text}", poll_interval=self._typing_poll_interval
+                )
                 
             elif action == "type":
                 if text is None:
@@ -107,28 +248,33 @@ class ComputerTool(BaseAnthropicTool):
                 if coordinate is not None:
                     raise ToolError("Coordinate is not accepted for type action")
                 
-                pyautogui.write(text, interval=0.01)
-                return await self._with_screenshot(f"Text typed: {text}")
+                await asyncio.to_thread(_send_unicode_text, text)
+                return await self._with_screenshot(
+                    f"Text typed: {text}", poll_interval=self._typing_poll_interval
+                )
                 
             # Click actions
             elif action == "left_click":
                 x, y = None, None
                 if coordinate is not None:
                     x, y = self._validate_coordinates(coordinate)
-                    pyautogui.click(x, y, button='left')
+                    await asyncio.to_thread(pyautogui.click, x, y, button='left')
                 else:
-                    pyautogui.click(button='left')
+                    await asyncio.to_thread(pyautogui.click, button='left')
+                await asyncio.sleep(self._post_action_settle[action])
                 
                 location = f" at {x}, {y}" if x is not None else ""
-                return await self._with_screenshot(f"Left click{location}")
+                return await self._with_screenshot(
+                    f"Left click{location}", location=(x, y) if x is not None else None
+                )
                 
             elif action == "right_click":
                 x, y = None, None
                 if coordinate is not None:
                     x, y = self._validate_coordinates(coordinate)
-                    pyautogui.click(x, y, button='right')
+                    await asyncio.to_thread(pyautogui.click, x, y, button='right')
                 else:
-                    pyautogui.click(button='right')
+                    await asyncio.to_thread(pyautogui.click, button='right')
                     
                 location = f" at {x}, {y}" if x is not None else ""
                 return await self._with_screenshot(f"Right click{location}")
@@ -137,9 +283,9 @@ class ComputerTool(BaseAnthropicTool):
                 x, y = None, None
                 if coordinate is not None:
                     x, y = self._validate_coordinates(coordinate)
-                    pyautogui.click(x, y, button='middle')
+                    await asyncio.to_thread(pyautogui.click, x, y, button='middle')
                 else:
-                    pyautogui.click(button='middle')
+                    await asyncio.to_thread(pyautogui.click, button='middle')
                     
                 location = f" at {x}, {y}" if x is not None else ""
                 return await self._with_screenshot(f"Middle click{location}")
@@ -148,31 +294,35 @@ class ComputerTool(BaseAnthropicTool):
                 x, y = None, None
                 if coordinate is not None:
                     x, y = self._validate_coordinates(coordinate)
-                    pyautogui.doubleClick(x, y)
+                    await asyncio.to_thread(pyautogui.doubleClick, x, y)
                 else:
-                    pyautogui.doubleClick()
+                    await asyncio.to_thread(pyautogui.doubleClick)
+                await asyncio.sleep(self._post_action_settle[action])
                     
                 location = f" at {x}, {y}" if x is not None else ""
-                return await self._with_screenshot(f"Double click{location}")
+                return await self._with_screenshot(
+                    f"Double click{location}", location=(x, y) if x is not None else None
+                )
                 
             elif action == "triple_click":
                 x, y = None, None
                 if coordinate is not None:
                     x, y = self._validate_coordinates(coordinate)
-                    pyautogui.tripleClick(x, y)
+                    await asyncio.to_thread(pyautogui.tripleClick, x, y)
                 else:
-                    pyautogui.tripleClick()
+                    await asyncio.to_thread(pyautogui.tripleClick)
+                await asyncio.sleep(self._post_action_settle[action])
                     
                 location = f" at {x}, {y}" if x is not None else ""
                 return await self._with_screenshot(f"Triple click{location}")
                 
             # Advanced mouse actions
             elif action == "left_mouse_down":
-                pyautogui.mouseDown(button='left')
+                await asyncio.to_thread(pyautogui.mouseDown, button='left')
                 return await self._with_screenshot("Left mouse button pressed down")
                 
             elif action == "left_mouse_up":
-                pyautogui.mouseUp(button='left')
+                await asyncio.to_thread(pyautogui.mouseUp, button='left')
                 return await self._with_screenshot("Left mouse button released")
                 
             elif action == "scroll":
@@ -181,21 +331,24 @@ class ComputerTool(BaseAnthropicTool):
                 if scroll_amount is None:
                     raise ToolError("Scroll amount is required for scroll action")
                 
+                location = None
                 if coordinate is not None:
-                    x, y = self._validate_coordinates(coordinate)
-                    pyautogui.moveTo(x, y)
+                    location = self._validate_coordinates(coordinate)
+                    await asyncio.to_thread(pyautogui.moveTo, *location)
                     
                 clicks = scroll_amount
                 if scroll_direction == "up":
-                    pyautogui.scroll(clicks)
+                    await asyncio.to_thread(pyautogui.scroll, clicks)
                 elif scroll_direction == "down":
-                    pyautogui.scroll(-clicks)
+                    await asyncio.to_thread(pyautogui.scroll, -clicks)
                 elif scroll_direction == "left":
-                    pyautogui.hscroll(-clicks)
+                    await asyncio.to_thread(pyautogui.hscroll, -clicks)
                 elif scroll_direction == "right":
-                    pyautogui.hscroll(clicks)
+                    await asyncio.to_thread(pyautogui.hscroll, clicks)
                     
-                return await self._with_screenshot(f"Scrolled {scroll_direction} by {scroll_amount}")
+                return await self._with_screenshot(
+                    f"Scrolled {scroll_direction} by {scroll_amount}", location=location
+                )
                 
             # Timing and special actions
             elif action == "hold_key":
@@ -207,9 +360,9 @@ class ComputerTool(BaseAnthropicTool):
                 if duration > 30:
                     raise ToolError("Duration must be 30 seconds or less")
                     
-                pyautogui.keyDown(text)
+                await asyncio.to_thread(pyautogui.keyDown, text)
                 await asyncio.sleep(duration)
-                pyautogui.keyUp(text)
+                await asyncio.to_thread(pyautogui.keyUp, text)
                 
                 return await self._with_screenshot(f"Held key {text} for {duration} seconds")
                 
@@ -225,13 +378,14 @@ class ComputerTool(BaseAnthropicTool):
                 
             # Information actions
             elif action == "screenshot":
-                return await self._take_screenshot()
+                return await self._take_screenshot(force=True)
                 
             elif action == "cursor_position":
                 x, y = pyautogui.position()
+                # The position is the point of this action, so reuse the last screenshot if there is one
                 return ToolResult(
                     output=f"Cursor position: X={x}, Y={y}",
-                    base64_image=(await self._take_screenshot()).base64_image
+                    image_bytes=self._last_image or (await self._take_screenshot()).image_bytes
                 )
                 
             else:
@@ -242,6 +396,13 @@ class ComputerTool(BaseAnthropicTool):
         except Exception as e:
             return ToolResult(error=f"An error occurred: {str(e)}")
     
+    @property
+    def _encode_buffer(self) -> io.BytesIO:
+        """Return the JPEG encode buffer, creating it on first use. Only call on the capture thread."""
+        if self._buffer is None:
+            self._buffer = io.BytesIO()
+        return self._buffer
+    
     def scale_coordinates(self, source_type, x, y):
         """
         Scale coordinates between full resolution and target resolution.
@@ -253,24 +414,9 @@ class ComputerTool(BaseAnthropicTool):
         Returns:
             Tuple of scaled (x, y) coordinates
         """
-        # Target resolution is XGA (1024x768)
-        target_width, target_height = 1024, 768
-        
-        # Get actual screen dimensions
-        actual_width, actual_height = self.width, self.height
-        
         if source_type == 'api':
-            # Scale from API coordinates (target resolution) to computer coordinates (actual resolution)
-            # Avoid division by zero if target dimensions are 0
-            scaled_x = int(x * (actual_width / target_width)) if target_width > 0 else 0
-            scaled_y = int(y * (actual_height / target_height)) if target_height > 0 else 0
-        else: # source_type == 'computer'
-            # Scale from computer coordinates (actual resolution) to API coordinates (target resolution)
-            # Avoid division by zero if actual dimensions are 0
-            scaled_x = int(x * (target_width / actual_width)) if actual_width > 0 else 0
-            scaled_y = int(y * (target_height / actual_height)) if actual_height > 0 else 0
-            
-        return scaled_x, scaled_y
+            return int(x * self._api_to_screen_x), int(y * self._api_to_screen_y)
+        return int(x * self._screen_to_api_x), int(y * self._screen_to_api_y)
         
     def _validate_coordinates(self, coordinate: Tuple[int, int]) -> Tuple[int, int]:
         """Validate coordinates and scale them to the actual screen resolution."""
@@ -278,45 +424,149 @@ class ComputerTool(BaseAnthropicTool):
             raise ToolError(f"{coordinate} must be a tuple of length 2")
             
         # Ensure coordinates are non-negative integers before scaling
-        if not all(isinstance(i, int) and i >= 0 for i in coordinate):
+        cx, cy = coordinate
+        if not (isinstance(cx, int) and isinstance(cy, int) and cx >= 0 and cy >= 0):
             raise ToolError(f"{coordinate} must be a tuple of non-negative integers")
             
-        # Scale from API coordinates (assuming 1024x768) to actual screen coordinates
-        x, y = self.scale_coordinates('api', coordinate[0], coordinate[1])
-        
-        # Check if the scaled coordinates are within screen bounds
-        # Use >= 0 check as well, although scale_coordinates should handle this implicitly
-        if not (0 <= x <= self.width and 0 <= y <= self.height):
+        # Scale from API coordinates (assuming 1024x768) to actual screen coordinates.
+        # Non-negative inputs times positive ratios can't go below zero, so only the
+        # upper bound needs checking.
+        x, y = int(cx * self._api_to_screen_x), int(cy * self._api_to_screen_y)
+        if x > self.width or y > self.height:
             raise ToolError(f"Scaled coordinates {x}, {y} are outside screen bounds ({self.width}x{self.height})")
             
         return x, y
     
-    async def _take_screenshot(self) -> ToolResult:
-        """Take a screenshot and scale it to target resolution."""
+    async def _take_screenshot(self, force: bool = False) -> ToolResult:
+        """
+        Take a screenshot and scale it to target resolution.
+        
+        If the scaled frame is identical to the previous one, the cached encoding is
+        returned instead of re-encoding it. Pass force=True to always re-encode.
+        """
         try:
-            # Take the screenshot
-            screenshot = ImageGrab.grab()
-            
-            # Scale down to XGA resolution (1024x768) using LANCZOS resampling
-            target_width, target_height = 1024, 768
-            scaled_screenshot = screenshot.resize((target_width, target_height), Image.LANCZOS)
-            
-            # Convert scaled image to base64
-            buffered = io.BytesIO()
-            scaled_screenshot.save(buffered, format="PNG")
-            img_str = base64.b64encode(buffered.getvalue()).decode()
-            
-            return ToolResult(base64_image=img_str)
+            # Capturing and encoding block for tens of milliseconds, so keep them off the event loop
+            image = await self._in_capture_thread(self._capture_and_encode, force)
+            return ToolResult(image_bytes=image)
         except Exception as e:
             return ToolResult(error=f"Failed to take screenshot: {str(e)}")
     
-    async def _with_screenshot(self, output: str) -> ToolResult:
-        """Add a screenshot to the specified output."""
-        # Add a small delay to allow UI to update
-        await asyncio.sleep(self._screenshot_delay)
-        screenshot = await self._take_screenshot()
-        return ToolResult(
-            output=output,
-            base64_image=screenshot.base64_image,
-            error=screenshot.error
-        )
\ No newline at end of file
+    def _capture_and_encode(self, force: bool = False) -> bytes:
+        """Capture the primary monitor and return it as JPEG bytes at target resolution."""
+        return self._encode_frame(*self._capture_frame(), force=force)
+    
+    def _capture_frame(self) -> Tuple[Image.Image, bytes]:
+        """Capture the primary monitor at target resolution, along with a digest of its pixels."""
+        # Take the screenshot of the primary monitor
+        raw = self._sct.grab(self._sct.monitors[1])
+        screenshot = Image.frombytes("RGB", raw.size, raw.bgra, "raw", "BGRX")
+        
+        # Scale down to the target resolution. The exact size is kept (not the aspect
+        # ratio) because scale_coordinates maps API coordinates onto it. reducing_gap
+        # lets Pillow shrink by an integer factor first, so BILINEAR only runs on a
+        # small image.
+        scaled_screenshot = screenshot.resize(self._target, Image.BILINEAR, reducing_gap=2.0)
+        self._screen = screenshot
+        self._region_captures = 0
+        
+        # An exact digest is used rather than a perceptual hash so that small changes
+        # (a typed character, a checkbox) always count as a different frame.
+        frame_hash = hashlib.blake2b(scaled_screenshot.tobytes(), digest_size=16).digest()
+        return scaled_screenshot, frame_hash
+    
+    def _check_region(self, location: Tuple[int, int]) -> Tuple[bytes, bool]:
+        """
+        Capture only the area around a screen location and compare it with the last full capture.
+        
+        Returns a digest of the area's pixels and whether they still match the last full capture.
+        """
+        monitor = self._sct.monitors[1]
+        region_width = min(self._region_size[0], monitor["width"])
+        region_height = min(self._region_size[1], monitor["height"])
+        
+        # Center the region on the location, shifted to stay inside the monitor
+        x, y = location
+        left = min(max(x - region_width // 2, 0), monitor["width"] - region_width)
+        top = min(max(y - region_height // 2, 0), monitor["height"] - region_height)
+        raw = self._sct.grab({
+            "left": monitor["left"] + left,
+            "top": monitor["top"] + top,
+            "width": region_width,
+            "height": region_height,
+        })
+        region = Image.frombytes("RGB", raw.size, raw.bgra, "raw", "BGRX").tobytes()
+        
+        box = (left, top, left + region_width, top + region_height)
+        unchanged = region == self._screen.crop(box).tobytes()
+        return hashlib.blake2b(region, digest_size=16).digest(), unchanged
+    
+    def _encode_frame(self, frame: Image.Image, frame_hash: bytes, force: bool = False) -> bytes:
+        """Encode a captured frame as JPEG, reusing the last encoding if the frame is unchanged."""
+        if not force and frame_hash == self._last_hash:
+            return self._last_image
+        
+        # Encode the scaled image. The buffer is reused across calls: it is rewound
+        # before writing and truncated afterwards, so its allocation is kept between shots.
+        # Base64 encoding is left to the API boundary, so the raw JPEG is what's kept.
+        buffered = self._encode_buffer
+        buffered.seek(0)
+        frame.save(
+            buffered, format="JPEG", quality=80, optimize=False, progressive=False, subsampling=2
+        )
+        buffered.truncate()
+        image = buffered.getvalue()
+        
+        self._last_hash, self._last_image = frame_hash, image
+        return image
+    
+    async def _with_screenshot(
+        self,
+        output: str,
+        poll_interval: Optional[float] = None,
+        location: Optional[Tuple[int, int]] = None,
+    ) -> ToolResult:
+        """
+        Add a screenshot to the specified output.
+        
+        Instead of sleeping for a fixed delay, the screen is captured every poll_interval
+        seconds until two consecutive frames match (the UI has settled) or
+        _screenshot_delay_max has passed. Only the final frame is encoded.
+        
+        If a screen location is given, only the area around it is polled first. If it
+        settles to exactly what the last full capture showed, the action most likely
+        changed nothing, and the last screenshot is returned again; otherwise a full
+        capture is taken. Every few actions a full capture is forced, so changes
+        elsewhere on screen don't go unnoticed for long.
+        """
+        interval = poll_interval or self._screenshot_poll_interval
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self._screenshot_delay_max
+        try:
+            if (
+                location is not None
+                and self._screen is not None
+                and self._last_image is not None
+                and self._region_captures < self._max_region_captures
+            ):
+                region_hash = None
+                while True:
+                    await asyncio.sleep(interval)
+                    previous_hash = region_hash
+                    region_hash, unchanged = await self._in_capture_thread(self._check_region, location)
+                    if region_hash == previous_hash or loop.time() >= deadline:
+                        break
+                if unchanged:
+                    self._region_captures += 1
+                    return ToolResult(output=output, image_bytes=self._last_image)
+            
+            frame_hash = None
+            while True:
+                await asyncio.sleep(interval)
+                previous_hash = frame_hash
+                frame, frame_hash = await self._in_capture_thread(self._capture_frame)
+                if frame_hash == previous_hash or loop.time() >= deadline:
+                    break
+            image = await self._in_capture_thread(self._encode_frame, frame, frame_hash)
+        except Exception as e:
+            return ToolResult(output=output, error=f"Failed to take screenshot: {str(e)}")
+        return ToolResult(output=output, image_bytes=image)
@@ -1,9 +1,53 @@
 import os
+import stat
+import tempfile
+import zlib
+from collections import OrderedDict, defaultdict, deque
 from pathlib import Path
 from typing import List, Literal, Optional, Union
 
 from .base import BaseAnthropicTool, ToolError, ToolResult
 
+def _skip_lines(text: str, pos: int, count: int) -> int:
+    """Return the offset just past the count-th newline at or after pos, or -1 if there aren't that many."""
+    if count <= 0:
+        return pos
+    # Skip whole chunks by counting their newlines (in C), then find() within the last one
+    while True:
+        chunk_end = min(pos + _SKIP_CHUNK, len(text))
+        in_chunk = text.count('\n', pos, chunk_end)
+        if in_chunk >= count or chunk_end == len(text):
+            break
+        count -= in_chunk
+        pos = chunk_end
+    for _ in range(count):
+        pos = text.find('\n', pos)
+        if pos < 0:
+            return -1
+        pos += 1
+    return pos
+
+def _number_lines(text: str, start: int = 1, end: Optional[int] = None) -> str:
+    """Return lines start..end (1-based, inclusive; end=None for all) of text, prefixed with line numbers."""
+    # Lines are counted like text.split('\n'); for a range, only that slice of the text is split
+    begin = _skip_lines(text, 0, start - 1)
+    if begin < 0 or (end is not None and end < start):
+        return ""
+    stop = -1 if end is None else _skip_lines(text, begin, end - start + 1)
+    return _join_numbered(text[begin:stop - 1 if stop >= 0 else None].split('\n'), start)
+
+def _join_numbered(lines, start: int = 1) -> str:
+    """Join already split lines, prefixing each with its line number counting from start."""
+    return '\n'.join([f"{i:4d} | {line}" for i, line in enumerate(lines, start)])
+
+_SKIP_CHUNK = 1 << 16  # Characters whose newlines _skip_lines counts at a time
+
+# The process umask, read once at import since os.umask can only be read by setting it
+_UMASK = os.umask(0)
+os.umask(_UMASK)
+
+HISTORY_LIMIT = 20  # Undo steps kept per file
+
 class EditorTool(BaseAnthropicTool):
     """
     A file editor tool that allows Claude to view, create, and edit files.
@@ -12,7 +56,12 @@ class EditorTool(BaseAnthropicTool):
     name = "str_replace_editor"
     api_type = "text_editor_20250124"
     
-    _file_history = {}  # Dict to store file history for undo operations
+    # path -> deque of zlib-compressed previous versions, for undo operations
+    _file_history = defaultdict(lambda: deque(maxlen=HISTORY_LIMIT))
+    _content_cache = OrderedDict()  # path -> (mtime_ns, size, text) for recently read files
+    _content_cache_size = 32
+    _fsync_writes = False  # fsync before replacing a file; slower, but survives power loss
+    _max_reported_occurrences = 5  # line numbers listed when old_str isn't unique
     
     def to_params(self) -> dict:
         """Returns the tool parameters for the Anthropic API."""
@@ -37,10 +86,10 @@ class EditorTool(BaseAnthropicTool):
         _path = Path(path)
         try:
             # Validate the path/command combination
-            self._validate_path(command, _path)
+            stat_result = self._validate_path(command, _path)
             
             if command == "view":
-                return await self._view(_path, view_range)
+                return await self._view(_path, view_range, stat_result)
                 
             elif command == "create":
                 if file_text is None:
@@ -50,14 +99,16 @@ class EditorTool(BaseAnthropicTool):
             elif command == "str_replace":
                 if old_str is None:
                     raise ToolError("Parameter 'old_str' is required for the 'str_replace' command")
-                return self._str_replace(_path, old_str, new_str or "")
+                if not old_str:
+                    raise ToolError("Parameter 'old_str' must not be empty for the 'str_replace' command")
+                return self._str_replace(_path, old_str, new_str or "", stat_result)
                 
             elif command == "insert":
                 if insert_line is None:
                     raise ToolError("Parameter 'insert_line' is required for the 'insert' command")
                 if new_str is None:
                     raise ToolError("Parameter 'new_str' is required for the 'insert' command")
-                return self._insert(_path, insert_line, new_str)
+                return self._insert(_path, insert_line, new_str, stat_result)
                 
             elif command == "undo_edit":
                 return self._undo_edit(_path)
@@ -70,8 +121,13 @@ class EditorTool(BaseAnthropicTool):
         except Exception as e:
             return ToolResult(error=f"An error occurred: {str(e)}")
     
-    def _validate_path(self, command: str, path: Path) -> None:
-        """Validate the path for the specified command."""
+    def _validate_path(self, command: str, path: Path) -> Optional[os.stat_result]:
+        """
+        Validate the path for the specified command.
+        
+        The path is stat'ed once, and the result (None if it doesn't exist) is returned
+        so the command can reuse it instead of stat'ing the path again.
+        """
         # Check if it's an absolute path
         if not path.is_absolute():
             suggested_path = Path(os.getcwd()) / path
@@ -79,42 +135,57 @@ class EditorTool(BaseAnthropicTool):
                 f"The path {path} is not an absolute path. Did you mean {suggested_path}?"
             )
             
+        try:
+            stat_result = path.stat()
+        except (FileNotFoundError, NotADirectoryError):
+            stat_result = None
+            
         # Check if path exists (except for create command)
-        if not path.exists() and command != "create":
+        if stat_result is None and command != "create":
             raise ToolError(f"The path {path} does not exist")
             
         # Check if path already exists for create command
-        if path.exists() and command == "create":
+        if stat_result is not None and command == "create":
             raise ToolError(f"File already exists at {path}")
             
         # Check if path is a directory (only view command can be used on directories)
-        if path.is_dir() and command != "view":
+        if stat_result is not None and stat.S_ISDIR(stat_result.st_mode) and command != "view":
             raise ToolError(f"The path {path} is a directory. Only the 'view' command can be used on directories")
+            
+        return stat_result
     
-    async def _view(self, path: Path, view_range: Optional[List[int]] = None) -> ToolResult:
+    async def _view(
+        self,
+        path: Path,
+        view_range: Optional[List[int]] = None,
+        stat_result: Optional[os.stat_result] = None,
+    ) -> ToolResult:
         """Implement the view command."""
-        if path.is_dir():
+        if stat_result is None:
+            stat_result = path.stat()
+        if stat.S_ISDIR(stat_result.st_mode):
             if view_range:
                 raise ToolError("The 'view_range' parameter cannot be used when viewing a directory")
                 
             try:
-                files = list(path.glob('*'))
+                # scandir yields names straight from the directory listing, without a Path per entry
+                with os.scandir(path) as entries:
+                    names = sorted(entry.name for entry in entries)
                 output = f"Contents of directory {path}:\n\n"
-                output += "\n".join(f"{i+1}. {f.name}" for i, f in enumerate(files))
+                output += "\n".join(f"{i+1}. {name}" for i, name in enumerate(names))
                 return ToolResult(output=output)
             except Exception as e:
                 raise ToolError(f"Failed to list directory contents: {str(e)}")
         
         # Read file content
-        file_content = self._read_file(path)
+        file_content = self._read_file(path, stat_result)
         
         # Apply view range if provided
         if view_range:
             if len(view_range) != 2 or not all(isinstance(i, int) for i in view_range):
                 raise ToolError("Invalid 'view_range'. It should be a list of two integers")
                 
-            lines = file_content.split('\n')
-            line_count = len(lines)
+            line_count = file_content.count('\n') + 1
             
             start, end = view_range
             if start < 1 or start > line_count:
@@ -123,21 +194,13 @@ class EditorTool(BaseAnthropicTool):
             if end != -1 and (end < start or end > line_count):
                 raise ToolError(f"Invalid 'view_range': End line {end} is out of range ({start}-{line_count})")
                 
-            if end == -1:
-                lines = lines[start-1:]
-            else:
-                lines = lines[start-1:end]
-                
-            file_content = '\n'.join(lines)
-            
             # Create line numbers
-            numbered_content = '\n'.join([f"{i+start:4d} | {line}" for i, line in enumerate(lines)])
+            numbered_content = _number_lines(file_content, start, None if end == -1 else end)
             output = f"File: {path} (lines {start}-{end if end != -1 else line_count}):\n\n{numbered_content}"
             
         else:
             # Create line numbers for all lines
-            lines = file_content.split('\n')
-            numbered_content = '\n'.join([f"{i+1:4d} | {line}" for i, line in enumerate(lines)])
+            numbered_content = _number_lines(file_content)
             output = f"File: {path}:\n\n{numbered_content}"
             
         return ToolResult(output=output)
@@ -155,52 +218,62 @@ class EditorTool(BaseAnthropicTool):
         except Exception as e:
             raise ToolError(f"Failed to create file: {str(e)}")
     
-    def _str_replace(self, path: Path, old_str: str, new_str: str) -> ToolResult:
+    def _str_replace(
+        self, path: Path, old_str: str, new_str: str, stat_result: Optional[os.stat_result] = None
+    ) -> ToolResult:
         """Implement the str_replace command."""
         # Read file content
-        file_content = self._read_file(path)
+        file_content = self._read_file(path, stat_result)
         
-        # Check if old_str exists in the file
-        occurrences = file_content.count(old_str)
-        if occurrences == 0:
+        # Locate old_str, and check that it occurs only once, in a single scan
+        index = file_content.find(old_str)
+        if index < 0:
             raise ToolError(f"No replacements made: '{old_str}' not found in {path}")
             
-        if occurrences > 1:
-            # Find line numbers of occurrences
-            lines = file_content.split('\n')
-            occurrences_lines = [i+1 for i, line in enumerate(lines) if old_str in line]
-            raise ToolError(f"Multiple occurrences of '{old_str}' found in lines {occurrences_lines}. Please make sure it is unique.")
+        end_index = index + len(old_str)
+        next_index = file_content.find(old_str, end_index)
+        if next_index >= 0:
+            # Find the starting line numbers of the first few occurrences, counting newlines
+            # only between consecutive hits (this also works when old_str spans lines)
+            line_num = file_content.count('\n', 0, index) + 1
+            occurrences_lines = [line_num]
+            while next_index >= 0 and len(occurrences_lines) < self._max_reported_occurrences:
+                line_num += file_content.count('\n', index, next_index)
+                if line_num != occurrences_lines[-1]:
+                    occurrences_lines.append(line_num)
+                index = next_index
+                next_index = file_content.find(old_str, index + len(old_str))
+            more = " and more" if next_index >= 0 else ""
+            raise ToolError(f"Multiple occurrences of '{old_str}' found in lines {occurrences_lines}{more}. Please make sure it is unique.")
             
         # Save to history before making changes
-        if path not in self._file_history:
-            self._file_history[path] = []
-        self._file_history[path].append(file_content)
+        self._file_history[path].append(zlib.compress(file_content.encode('utf-8'), 1))
         
         # Replace old_str with new_str
-        new_content = file_content.replace(old_str, new_str)
+        new_content = file_content[:index] + new_str + file_content[end_index:]
         
         # Write updated content
         self._write_file(path, new_content)
         
         # Find the line number of the replacement for better feedback
-        line_num = file_content.split(old_str)[0].count('\n') + 1
+        line_num = file_content.count('\n', 0, index) + 1
         
-        # Create a snippet of the changed area
+        # Create a snippet of the changed area (_number_lines stops at the end of the file)
         context_lines = 3  # Show 3 lines before and after the change
-        lines = new_content.split('\n')
         start_line = max(0, line_num - context_lines - 1)
-        end_line = min(len(lines), line_num + context_lines)
+        end_line = line_num + context_lines
         
-        snippet_lines = [f"{i+1:4d} | {line}" for i, line in enumerate(lines[start_line:end_line])]
-        snippet = '\n'.join(snippet_lines)
+        snippet = _number_lines(new_content, start_line + 1, end_line)
         
         output = f"File {path} has been edited. Here's a snippet of the result:\n\n{snippet}"
         return ToolResult(output=output)
     
-    def _insert(self, path: Path, insert_line: int, new_str: str) -> ToolResult:
+    def _insert(
+        self, path: Path, insert_line: int, new_str: str, stat_result: Optional[os.stat_result] = None
+    ) -> ToolResult:
         """Implement the insert command."""
         # Read file content
-        file_content = self._read_file(path)
+        file_content = self._read_file(path, stat_result)
         lines = file_content.split('\n')
         
         # Check if insert_line is valid
@@ -208,9 +281,7 @@ class EditorTool(BaseAnthropicTool):
             raise ToolError(f"Invalid 'insert_line' parameter: {insert_line}. Should be between 0 and {len(lines)}")
             
         # Save to history before making changes
-        if path not in self._file_history:
-            self._file_history[path] = []
-        self._file_history[path].append(file_content)
+        self._file_history[path].append(zlib.compress(file_content.encode('utf-8'), 1))
         
         # Insert the new string
         new_lines = new_str.split('\n')
@@ -225,41 +296,103 @@ class EditorTool(BaseAnthropicTool):
         start_line = max(0, insert_line - context_lines)
         end_line = min(len(result_lines), insert_line + len(new_lines) + context_lines)
         
-        snippet_lines = [f"{i+1:4d} | {line}" for i, line in enumerate(result_lines[start_line:end_line])]
-        snippet = '\n'.join(snippet_lines)
+        # The lines were already split for the insert, so number the slice directly
+        snippet = _join_numbered(result_lines[start_line:end_line], start_line + 1)
         
         output = f"File {path} has been edited. Here's a snippet of the result:\n\n{snippet}"
         return ToolResult(output=output)
     
     def _undo_edit(self, path: Path) -> ToolResult:
         """Implement the undo_edit command."""
-        if path not in self._file_history or not self._file_history[path]:
+        if not self._file_history[path]:
             raise ToolError(f"No edit history found for {path}")
             
         # Get the last version and restore it
-        previous_content = self._file_history[path].pop()
+        previous_content = zlib.decompress(self._file_history[path].pop()).decode('utf-8')
         self._write_file(path, previous_content)
         
-        lines = previous_content.split('\n')
-        snippet_lines = [f"{i+1:4d} | {line}" for i, line in enumerate(lines[:10])]  # Show first 10 lines
-        snippet = '\n'.join(snippet_lines)
+        snippet = _number_lines(previous_content, 1, 10)  # Show first 10 lines
         
-        if len(lines) > 10:
+        if previous_content.count('\n') >= 10:
             snippet += "\n... (file continues)"
             
         output = f"Last edit to {path} undone successfully. Here's a preview:\n\n{snippet}"
         return ToolResult(output=output)
     
-    def _read_file(self, path: Path) -> str:
-        """Read the content of a file."""
+    def _read_file(self, path: Path, stat_result: Optional[os.stat_result] = None) -> str:
+        """
+        Read the content of a file, reusing the cached text if the file hasn't changed.
+        
+        A stat result taken just before (e.g. by _validate_path) can be passed in to skip
+        stat'ing the file again.
+        """
         try:
-            return path.read_text(encoding='utf-8')
+            if stat_result is None:
+                stat_result = os.stat(path)
+            cached = self._content_cache.get(path)
+            if cached is not None and cached[:2] == (stat_result.st_mtime_ns, stat_result.st_size):
+                self._content_cache.move_to_end(path)
+                return cached[2]
+            
+            content = path.read_text(encoding='utf-8')
+            self._cache_content(path, content, stat_result)
+            return content
         except Exception as e:
+            self._content_cache.pop(path, None)
             raise ToolError(f"Failed to read file {path}: {str(e)}")
     
     def _write_file(self, path: Path, content: str) -> None:
-        """Write content to a file."""
+        """
+        Write content to a file.
+        
+        The text is encoded once and written to a temporary sibling with a single
+        os.write loop, which then replaces the file. An interrupted write never
+        leaves a truncated file behind.
+        """
+        # Write through symlinks to the real file, and keep its permissions
+        target = Path(os.path.realpath(path))
+        tmp_path = None
         try:
-            path.write_text(content, encoding='utf-8')
+            try:
+                mode = stat.S_IMODE(os.stat(target).st_mode)
+            except FileNotFoundError:
+                # mkstemp creates the file as 0o600; give new files the usual 0o666 less umask
+                mode = 0o666 & ~_UMASK
+            
+            # Match the newline translation that text mode would apply
+            if os.linesep != '\n':
+                content_to_write = content.replace('\n', os.linesep)
+            else:
+                content_to_write = content
+            data = memoryview(content_to_write.encode('utf-8'))
+            
+            # A fresh name created with O_EXCL (and O_BINARY on Windows), so an existing
+            # file is never clobbered and concurrent writers don't share a temp file
+            fd, tmp_path = tempfile.mkstemp(dir=target.parent, prefix=f".{target.name}.", suffix='.tmp')
+            try:
+                while data:
+                    data = data[os.write(fd, data):]
+                if self._fsync_writes:
+                    os.fsync(fd)
+            finally:
+                os.close(fd)
+            os.chmod(tmp_path, mode)
+            os.replace(tmp_path, target)
+            
+            # Cache what was just written so the next read doesn't go back to disk
+            self._cache_content(path, content, os.stat(target))
         except Exception as e:
-            raise ToolError(f"Failed to write to file {path}: {str(e)}")
\ No newline at end of file
+            self._content_cache.pop(path, None)
+            if tmp_path is not None:
+                try:
+                    os.unlink(tmp_path)
+                except OSError:
+                    pass
+            raise ToolError(f"Failed to write to file {path}: {str(e)}")
+    
+    def _cache_content(self, path: Path, content: str, stat_result: os.stat_result) -> None:
+        """Remember a file's text along with the mtime and size it was read at."""
+        self._content_cache[path] = (stat_result.st_mtime_ns, stat_result.st_size, content)
+        self._content_cache.move_to_end(path)
+        while len(self._content_cache) > self._content_cache_size:
+            self._content_cache.popitem(last=False)
\ No newline at end of file
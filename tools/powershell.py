@@ -1,20 +1,93 @@
 import asyncio
 import os
+import queue
+import signal
 import subprocess
+import sys
+import threading
+import time
+import uuid
 from typing import Literal, Optional
 
+import pybase64
+
 from .base import BaseAnthropicTool, PowerShellResult, ToolError, ToolResult
 
+class _StreamOutput:
+    """One stream's output for the current command, capped as it arrives."""
+    
+    def __init__(self, marker: bytes, max_output: int):
+        self.marker = marker
+        self.max_output = max_output
+        self.buffer = bytearray()
+        self.truncated = False
+        self.found = False
+        self.done = False
+        self._search_from = 0
+    
+    def feed(self, chunk: Optional[bytes]) -> None:
+        """Add a chunk read from the stream, or None at EOF."""
+        if self.done:
+            return
+        if chunk is None:
+            # The process exited before writing the marker line
+            self.done = True
+            self._cap(len(self.buffer))
+            return
+        if self.found:
+            # Wait for the end of the marker line too, so it doesn't leak into the next command
+            self.done = b"\n" in chunk
+            return
+        
+        self.buffer.extend(chunk)
+        index = self.buffer.find(self.marker, self._search_from)
+        if index >= 0:
+            self.found = True
+            self.done = self.buffer.find(b"\n", index + len(self.marker)) >= 0
+            self._cap(index)
+            return
+        if len(self.buffer) > self.max_output + len(self.marker):
+            # Keep draining so the shell stays usable, but only hold on to the tail
+            # that may still contain the start of the marker
+            self.truncated = True
+            del self.buffer[self.max_output:len(self.buffer) - len(self.marker)]
+        self._search_from = max(0, len(self.buffer) - len(self.marker) + 1)
+    
+    def _cap(self, end: int) -> None:
+        """Drop everything from end on, noting whether any of it was output past the cap."""
+        if end > self.max_output:
+            self.truncated = True
+        del self.buffer[min(end, self.max_output):]
+    
+    def result(self) -> bytes:
+        """Return the kept output, with a note if any of it was dropped."""
+        if self.truncated:
+            self.buffer.extend(b"\n[Output truncated at %d bytes]\n" % self.max_output)
+        return bytes(self.buffer)
+
 class PowerShellTool(BaseAnthropicTool):
     """
     A tool that allows Claude to run PowerShell commands on Windows.
+    
+    Commands run in one long-lived PowerShell process, so startup cost is paid once
+    and session state (current directory, variables) carries over between commands.
     """
     
     name = "bash"
     api_type = "bash_20250124"
     
-    _process = None
     _timeout = 60.0  # default timeout in seconds
+    _read_size = 65536
+    _max_output = 1 << 20  # bytes kept per stream; the rest is drained and dropped
+    _max_queued = 16  # chunks read ahead of the consumer, across both streams
+    
+    def __init__(self):
+        super().__init__()
+        self._process = None
+        self._chunks = None
+        self._pumps_stopped = None
+        # The process is driven from worker threads so it outlives any one event loop
+        self._lock = threading.Lock()
     
     def to_params(self) -> dict:
         """Returns the tool parameters for the Anthropic API."""
@@ -40,27 +113,163 @@ class PowerShellTool(BaseAnthropicTool):
     
     async def _restart(self) -> ToolResult:
         """Restart the PowerShell tool."""
+        self._kill()
         return PowerShellResult(system="PowerShell tool has been restarted.")
     
-    async def _run_command(self, command: str) -> ToolResult:
-        """Run a PowerShell command and return the result."""
+    def close(self) -> None:
+        """Terminate the PowerShell process; called when the tool is thrown away."""
+        self._kill()
+    
+    def _kill(self) -> None:
+        """Terminate the PowerShell process and everything it started; the next command starts a new one."""
+        process, self._process = self._process, None
+        if process is None:
+            return
+        # Let the pump threads stop instead of waiting on a queue nobody reads any more
+        self._pumps_stopped.set()
+        if process.poll() is None:
+            # Children that inherited the pipes would keep them open, so kill the whole tree
+            try:
+                if sys.platform == "win32":
+                    subprocess.run(
+                        ["taskkill", "/F", "/T", "/PID", str(process.pid)],
+                        stdout=subprocess.DEVNULL,
+                        stderr=subprocess.DEVNULL,
+                        creationflags=subprocess.CREATE_NO_WINDOW,
+                        timeout=10
+                    )
+                else:
+                    os.killpg(process.pid, signal.SIGKILL)
+            except (OSError, subprocess.SubprocessError):
+                pass
+            try:
+                process.kill()
+                process.wait(timeout=5)
+            except (OSError, subprocess.SubprocessError):
+                pass
         try:
-            # Run PowerShell with the specified command
-            process = await asyncio.create_subprocess_exec(
-                "powershell.exe", 
-                "-Command", 
-                command,
-                stdout=asyncio.subprocess.PIPE,
-                stderr=asyncio.subprocess.PIPE
+            process.stdin.close()
+        except OSError:
+            pass
+    
+    def _get_process(self) -> subprocess.Popen:
+        """Return the running PowerShell process, starting one if needed."""
+        if self._process is not None and self._process.poll() is not None:
+            self._kill()
+        if self._process is None:
+            self._process = subprocess.Popen(
+                [
+                    "powershell.exe",
+                    "-NoProfile",
+                    "-NoLogo",
+                    "-NonInteractive",
+                    "-Command",
+                    "-",
+                ],
+                stdin=subprocess.PIPE,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.PIPE,
+                # Own process group, so a timeout can kill the commands' children as well
+                start_new_session=sys.platform != "win32"
             )
+            # Daemon threads drain both pipes into one bounded queue; they may block for as
+            # long as an orphaned child keeps a pipe open, but nothing ever waits on them
+            self._chunks = queue.Queue(maxsize=self._max_queued)
+            self._pumps_stopped = threading.Event()
+            for index, stream in enumerate((self._process.stdout, self._process.stderr)):
+                threading.Thread(
+                    target=self._pump,
+                    args=(index, stream, self._chunks, self._pumps_stopped),
+                    daemon=True
+                ).start()
+        return self._process
+    
+    def _pump(self, index: int, stream, chunks: queue.Queue, stopped: threading.Event) -> None:
+        """Move everything read from a pipe into the queue as (index, chunk), then (index, None) at EOF."""
+        try:
+            while True:
+                chunk = stream.read1(self._read_size)
+                if not chunk:
+                    break
+                if not self._put(chunks, (index, chunk), stopped):
+                    return
+        except (OSError, ValueError):
+            pass
+        self._put(chunks, (index, None), stopped)
+    
+    @staticmethod
+    def _put(chunks: queue.Queue, item: tuple, stopped: threading.Event) -> bool:
+        """Wait for room in the bounded queue; gives up once the process has been killed."""
+        while not stopped.is_set():
+            try:
+                chunks.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+    
+    def _read_output(self, marker: bytes, deadline: float) -> tuple:
+        """
+        Collect stdout and stderr together until both have written the marker line.
+        
+        Both streams are read in one loop, so neither piles up in its queue while the
+        other is being waited on, and each is capped as its chunks arrive.
+        Raises TimeoutError if the marker lines haven't arrived by the deadline.
+        """
+        outputs = (_StreamOutput(marker, self._max_output), _StreamOutput(marker, self._max_output))
+        while not all(output.done for output in outputs):
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise TimeoutError
+            try:
+                index, chunk = self._chunks.get(timeout=remaining)
+            except queue.Empty:
+                raise TimeoutError
+            outputs[index].feed(chunk)
+        return tuple(output.result() for output in outputs)
+    
+    def _execute(self, command: str) -> tuple:
+        """
+        Send a command to the PowerShell process and collect its stdout and stderr.
+        
+        Waiting for the lock and for the output share one deadline, so this always
+        returns (or raises TimeoutError) within the timeout.
+        """
+        deadline = time.monotonic() + self._timeout
+        if not self._lock.acquire(timeout=self._timeout):
+            raise TimeoutError
+        try:
+            process = self._get_process()
+            
+            # A random marker per command, echoed on both streams, delimits its output
+            marker = f"<<<EOF_{uuid.uuid4().hex}>>>"
+            # Ship the command as base64 UTF-16LE so PowerShell never has to parse its
+            # quoting or line continuations; dot-sourcing keeps state in the session scope
+            encoded = pybase64.b64encode_as_string(command.encode('utf-16-le'))
+            script = (
+                ". ([ScriptBlock]::Create([Text.Encoding]::Unicode.GetString("
+                f"[Convert]::FromBase64String('{encoded}'))))\n"
+                f"Write-Output '{marker}'\n"
+                f"[Console]::Error.WriteLine('{marker}')\n"
+            )
+            process.stdin.write(script.encode('utf-8'))
+            process.stdin.flush()
             
             try:
-                stdout, stderr = await asyncio.wait_for(
-                    process.communicate(), 
-                    timeout=self._timeout
-                )
-            except asyncio.TimeoutError:
-                process.kill()
+                stdout, stderr = self._read_output(marker.encode(), deadline)
+            except TimeoutError:
+                self._kill()
+                raise
+            return stdout, stderr
+        finally:
+            self._lock.release()
+    
+    async def _run_command(self, command: str) -> ToolResult:
+        """Run a PowerShell command and return the result."""
+        try:
+            try:
+                stdout, stderr = await asyncio.to_thread(self._execute, command)
+            except TimeoutError:
                 return PowerShellResult(
                     error=f"Command timed out after {self._timeout} seconds"
                 )
@@ -73,4 +282,5 @@ class PowerShellTool(BaseAnthropicTool):
                 error=stderr_text if stderr_text else None
             )
         except Exception as e:
+            self._kill()
             return PowerShellResult(error=f"Failed to run PowerShell command: {str(e)}")
\ No newline at end of file
@@ -1,14 +1,13 @@
 """Windows Computer Control Agent using Anthropic API."""
 
 import asyncio
-import base64
 import datetime
-import json
 import logging
 from typing import Any, Callable, Dict, List, Optional, Union, cast
 
+import pybase64
 from anthropic import Anthropic
-from anthropic.types import ContentBlock, TextBlock, ToolUseBlock
+from anthropic.types import ContentBlock
 from anthropic.types.beta import (
     BetaContentBlockParam,
     BetaImageBlockParam,
@@ -18,7 +17,7 @@ from anthropic.types.beta import (
     BetaToolUseBlockParam,
 )
 
-from config import load_config
+from config import EVICTED_IMAGE_PREFIX, load_config
 from tools import ComputerTool, EditorTool, PowerShellTool, ToolError, ToolResult
 
 # Configure logging
@@ -30,47 +29,117 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 
 def filter_recent_screenshots(messages, keep_count=3):
-    """Keep only the most recent N screenshots in the conversation history."""
-    # Find all image blocks in the messages
-    image_blocks = []
+    """
+    Keep only the most recent N screenshots in the conversation history.
     
+    If there are more images than keep_count (counting both those directly in a
+    message and inside tool results), they are kept newest-first in a single
+    reverse pass; keep_count=None keeps them all. Placeholders the app leaves for
+    screenshots it evicted from the history are always dropped, since they tell
+    Claude nothing. The input list is not modified: the result
+    shares every unchanged message with it, and only messages that lose a block
+    are replaced by shallow copies. If nothing is dropped, the input list itself is
+    returned. Callers must therefore treat message dicts as immutable.
+    """
+    # Cheap count-only pass first: short conversations never need filtering
+    images = placeholders = 0
     for message in messages:
-        if isinstance(message.get("content"), list):
-            for i, block in enumerate(message["content"]):
-                # Check if block is a dictionary before accessing keys
-                if isinstance(block, dict) and block.get("type") == "image":
-                    image_blocks.append((message, i, block))
+        content = message.get("content")
+        if isinstance(content, list):
+            counts = _count_images(content)
+            images += counts[0]
+            placeholders += counts[1]
+    if not placeholders and (keep_count is None or images <= keep_count):
+        return messages
     
-    # If we have more images than we want to keep, remove the oldest ones
-    if len(image_blocks) > keep_count:
-        # Sort by recency (assuming later in the list is more recent)
-        to_remove = image_blocks[:-keep_count]
-        
-        # Remove the oldest images by setting their content to None
-        for message, index, _ in to_remove:
-            # Ensure content is a list and index is valid
-            if isinstance(message.get("content"), list) and index < len(message["content"]):
-                 message["content"][index] = None # Mark for removal
-            
-        # Clean up None values from content lists
-        for message in messages:
-            if isinstance(message.get("content"), list):
-                message["content"] = [item for item in message["content"] if item is not None]
+    budget = images if keep_count is None else keep_count
+    result = None
+    for i in range(len(messages) - 1, -1, -1):
+        content = messages[i].get("content")
+        if isinstance(content, list):
+            new_content, budget = _drop_old_images(content, budget)
+            if new_content is not content:
+                if result is None:
+                    result = list(messages)
+                result[i] = {**messages[i], "content": new_content}
+    return messages if result is None else result
+
+def _is_evicted_placeholder(block):
+    """Return whether a text block stands in for a screenshot the app evicted from the history."""
+    return block.get("type") == "text" and str(block.get("text", "")).startswith(EVICTED_IMAGE_PREFIX)
+
+def _count_images(blocks):
+    """Count image blocks and evicted-screenshot placeholders, including those nested in tool results."""
+    images = placeholders = 0
+    for block in blocks:
+        if not isinstance(block, dict):
+            continue
+        if block.get("type") == "image":
+            images += 1
+        elif block.get("type") == "tool_result" and isinstance(block.get("content"), list):
+            inner_images, inner_placeholders = _count_images(block["content"])
+            images += inner_images
+            placeholders += inner_placeholders
+        elif _is_evicted_placeholder(block):
+            placeholders += 1
+    return images, placeholders
+
+def _drop_old_images(blocks, budget):
+    """
+    Walk content blocks newest-first, keeping image blocks while the budget lasts.
+    Evicted-screenshot placeholders are always dropped.
+    
+    Returns the filtered blocks (the same list object if nothing was dropped) and the
+    remaining budget.
+    """
+    drop = set()
+    replaced = {}
+    for i in range(len(blocks) - 1, -1, -1):
+        block = blocks[i]
+        # Check if block is a dictionary before accessing keys
+        if not isinstance(block, dict):
+            continue
+        if block.get("type") == "image":
+            if budget > 0:
+                budget -= 1
+            else:
+                drop.add(i)
+        elif block.get("type") == "tool_result" and isinstance(block.get("content"), list):
+            inner, budget = _drop_old_images(block["content"], budget)
+            if inner is not block["content"]:
+                replaced[i] = {**block, "content": inner}
+        elif _is_evicted_placeholder(block):
+            drop.add(i)
     
-    return messages
+    if not drop and not replaced:
+        return blocks, budget
+    return [replaced.get(i, block) for i, block in enumerate(blocks) if i not in drop], budget
 
 class WindowsAgent:
     """Agent for controlling Windows with Claude."""
 
-    def __init__(self):
-        """Initialize the agent."""
+    def __init__(
+        self,
+        *,
+        api_key: Optional[str] = None,
+        model: Optional[str] = None,
+        system_prompt: Optional[str] = None,
+        max_tokens: Optional[int] = None,
+        thinking_budget: Optional[int] = None,
+        only_n_most_recent_images: Optional[int] = None,
+    ):
+        """Initialize the agent. Settings that are not passed are read from the config file."""
         self.config = load_config()
-        self.api_key = self.config["api_key"]
-        self.model = self.config["model"]
-        self.max_tokens = self.config["max_output_tokens"]
-        self.thinking_budget = self.config["thinking_budget"]
-        self.system_prompt = self.config["system_prompt"]
-        self.only_n_most_recent_images = self.config.get("only_n_most_recent_images", 3)
+        self.api_key = api_key if api_key is not None else self.config["api_key"]
+        self.model = model if model is not None else self.config["model"]
+        self.max_tokens = max_tokens if max_tokens is not None else self.config["max_output_tokens"]
+        self.thinking_budget = thinking_budget if thinking_budget is not None else self.config["thinking_budget"]
+        self.system_prompt = system_prompt if system_prompt is not None else self.config["system_prompt"]
+        self.only_n_most_recent_images = (
+            only_n_most_recent_images
+            if only_n_most_recent_images is not None
+            else self.config.get("only_n_most_recent_images", 3)
+        )
         
         # Initialize tools
         self.computer_tool = ComputerTool()
@@ -83,9 +152,21 @@ class WindowsAgent:
             for tool in [self.computer_tool, self.powershell_tool, self.editor_tool]
         }
         
+        # The system prompt and tool definitions don't change for the agent's lifetime
+        self._system = BetaTextBlockParam(type="text", text=self.system_prompt)
+        self._tool_params = [tool.to_params() for tool in self.tools.values()]
+        
         # Initialize Anthropic client
         self.client = Anthropic(api_key=self.api_key)
         
+    def close(self) -> None:
+        """Release the tools' resources (PowerShell process, screen grabber) and the API client."""
+        for tool in self.tools.values():
+            close = getattr(tool, "close", None)
+            if close is not None:
+                close()
+        self.client.close()
+    
     async def start_conversation(
         self,
         messages: List[BetaMessageParam],
@@ -103,12 +184,6 @@ class WindowsAgent:
         Returns:
             Updated message history
         """
-        # Create system message
-        system = BetaTextBlockParam(type="text", text=self.system_prompt)
-        
-        # Get tools parameters
-        tool_params = [tool.to_params() for tool in self.tools.values()]
-        
         # Configure thinking parameter if needed
         thinking_param = None
         temperature_value = 0
@@ -121,83 +196,87 @@ class WindowsAgent:
             temperature_value = 1
         
         try:
-            # Right before calling the Claude API
-            if self.only_n_most_recent_images and self.only_n_most_recent_images > 0:
-                # We need to operate on a copy if messages is used elsewhere
-                messages_to_send = filter_recent_screenshots(messages.copy(), keep_count=self.only_n_most_recent_images)
-            else:
-                messages_to_send = messages
-            
-            # Call Claude API
-            response = self.client.beta.messages.create(
-                model=self.model,
-                max_tokens=self.max_tokens,
-                messages=messages_to_send, # Use the potentially filtered messages
-                system=[system],
-                tools=tool_params,
-                temperature=temperature_value,
-                betas=["computer-use-2025-01-24"],
-                **({"thinking": thinking_param} if thinking_param else {})
-            )
-            
-            # Process response content blocks
-            response_params = self._response_to_params(response.content)
-            messages.append(
-                {
-                    "role": "assistant",
-                    "content": response_params,
-                }
-            )
-            
-            # Handle tool calls
-            tool_result_content = []
-            for content_block in response_params:
-                # Send content to callback
-                output_callback(content_block)
+            # One API round trip per iteration, until Claude stops asking for tools
+            while True:
+                # Right before calling the Claude API. Evicted-screenshot placeholders are
+                # dropped even when the number of images isn't limited.
+                if self.only_n_most_recent_images and self.only_n_most_recent_images > 0:
+                    keep_count = self.only_n_most_recent_images
+                else:
+                    keep_count = None
+                # Returns a new list sharing the unchanged messages; messages itself is left as is
+                messages_to_send = filter_recent_screenshots(messages, keep_count=keep_count)
                 
-                # Handle tool use blocks
-                if content_block["type"] == "tool_use":
-                    # Get tool and run it
-                    tool_name = content_block["name"]
-                    tool_input = cast(Dict[str, Any], content_block["input"])
-                    tool_id = content_block["id"]
+                # Call Claude API
+                response = self.client.beta.messages.create(
+                    model=self.model,
+                    max_tokens=self.max_tokens,
+                    messages=messages_to_send, # Use the potentially filtered messages
+                    system=[self._system],
+                    tools=self._tool_params,
+                    temperature=temperature_value,
+                    betas=["computer-use-2025-01-24"],
+                    **({"thinking": thinking_param} if thinking_param else {})
+                )
+                
+                # Process response content blocks
+                response_params = self._response_to_params(response.content)
+                messages.append(
+                    {
+                        "role": "assistant",
+                        "content": response_params,
+                    }
+                )
+                
+                # Handle tool calls
+                tool_result_content = []
+                for content_block in response_params:
+                    # Send content to callback
+                    output_callback(content_block)
                     
-                    try:
-                        # Run tool
-                        tool = self.tools.get(tool_name)
-                        if not tool:
-                            result = ToolResult(error=f"Tool {tool_name} not found")
-                        else:
-                            result = await tool(**tool_input)
-                        
-                        # Create API tool result
-                        tool_result = self._make_tool_result(result, tool_id)
-                        tool_result_content.append(tool_result)
-                        
-                        # Send tool result to callback
-                        if tool_output_callback:
-                            tool_output_callback(result, tool_id)
-                        output_callback(result)
-                    except Exception as e:
-                        logger.error(f"Error running tool {tool_name}: {str(e)}")
-                        tool_result = self._make_tool_result(
-                            ToolResult(error=f"Error: {str(e)}"), 
-                            tool_id,
-                            is_error=True
-                        )
-                        tool_result_content.append(tool_result)
+                    # Handle tool use blocks
+                    if content_block["type"] == "tool_use":
+                        # Get tool and run it
+                        tool_name = content_block["name"]
+                        tool_input = cast(Dict[str, Any], content_block["input"])
+                        tool_id = content_block["id"]
                         
-                        # Send error to callback
-                        if tool_output_callback:
-                            tool_output_callback(ToolResult(error=f"Error: {str(e)}"), tool_id)
-                        output_callback(f"Error running tool {tool_name}: {str(e)}")
-            
-            # If tools were used, send results back to Claude
-            if tool_result_content:
-                messages.append({"content": tool_result_content, "role": "user"})
-                return await self.start_conversation(messages, output_callback, tool_output_callback)
-            
-            return messages
+                        try:
+                            # Run tool
+                            tool = self.tools.get(tool_name)
+                            if not tool:
+                                result = ToolResult(error=f"Tool {tool_name} not found")
+                            else:
+                                result = await tool(**tool_input)
+                            
+                            # Create API tool result
+                            tool_result = self._make_tool_result(result, tool_id)
+                            tool_result_content.append(tool_result)
+                            
+                            # Send tool result to callback
+                            if tool_output_callback:
+                                tool_output_callback(result, tool_id)
+                            output_callback(result)
+                        except Exception as e:
+                            logger.error(f"Error running tool {tool_name}: {str(e)}")
+                            tool_result = self._make_tool_result(
+                                ToolResult(error=f"Error: {str(e)}"), 
+                                tool_id,
+                                is_error=True
+                            )
+                            tool_result_content.append(tool_result)
+                            
+                            # Send error to callback
+                            if tool_output_callback:
+                                tool_output_callback(ToolResult(error=f"Error: {str(e)}"), tool_id)
+                            output_callback(f"Error running tool {tool_name}: {str(e)}")
+                
+                # If tools were used, send results back to Claude
+                if tool_result_content:
+                    messages.append({"content": tool_result_content, "role": "user"})
+                    continue
+                
+                return messages
         
         except Exception as e:
             logger.error(f"Error in conversation: {str(e)}")
@@ -208,23 +287,31 @@ class WindowsAgent:
         """Convert API response content to message parameters."""
         result = []
         for block in content:
-            if isinstance(block, TextBlock):
+            # Dispatch on the type tag: the beta endpoint returns Beta* block classes,
+            # which are not instances of TextBlock/ToolUseBlock
+            block_type = getattr(block, "type", None)
+            if block_type == "text":
                 # Handle text blocks
                 if block.text:
                     result.append(BetaTextBlockParam(type="text", text=block.text))
                     
+            elif block_type == "thinking":
                 # Handle thinking blocks
-                elif getattr(block, "type", None) == "thinking":
-                    thinking_block = {
-                        "type": "thinking",
-                        "thinking": getattr(block, "thinking", None),
-                    }
-                    if hasattr(block, "signature"):
-                        thinking_block["signature"] = getattr(block, "signature", None)
-                    result.append(cast(BetaContentBlockParam, thinking_block))
-            elif isinstance(block, ToolUseBlock):
-                # Handle tool use blocks
-                result.append(cast(BetaToolUseBlockParam, block.model_dump()))
+                thinking_block = {
+                    "type": "thinking",
+                    "thinking": getattr(block, "thinking", None),
+                }
+                if hasattr(block, "signature"):
+                    thinking_block["signature"] = getattr(block, "signature", None)
+                result.append(cast(BetaContentBlockParam, thinking_block))
+            elif block_type == "tool_use":
+                # Handle tool use blocks; built directly, as model_dump is much slower
+                result.append(BetaToolUseBlockParam(
+                    type="tool_use",
+                    id=block.id,
+                    name=block.name,
+                    input=block.input,
+                ))
             else:
                 # Other blocks
                 result.append(cast(BetaContentBlockParam, block.model_dump()))
@@ -256,13 +343,14 @@ class WindowsAgent:
                 })
                 
             # Handle screenshots
-            if result.base64_image:
+            if result.image_bytes:
                 tool_result_content.append({
                     "type": "image",
                     "source": {
                         "type": "base64",
-                        "media_type": "image/png",
-                        "data": result.base64_image,
+                        "media_type": "image/jpeg",
+                        # Screenshots are kept as raw bytes and only encoded here
+                        "data": pybase64.b64encode_as_string(result.image_bytes),
                     },
                 })
                 